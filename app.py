@@ -1,14 +1,20 @@
 import os
 import ipaddress
-import math
+import socket
+import struct
 import time
-import json
-import uuid
+import secrets
+import itertools
 import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import Optional, Tuple, List, Dict, Literal
 
 import psycopg2
 import psycopg2.extras
+from psycopg2.extras import Json, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from psycopg2 import sql
 from psycopg2 import errors as pg_errors
 
@@ -37,6 +43,15 @@ DB_DSN = (
     f" host={os.getenv('POSTGRES_HOST','postgres')}"
 )
 MAX_RETRIES = 5
+MAX_BATCH_ITEMS = 100
+# Every allocation takes this transaction-scoped advisory lock, so allocators
+# (across all API replicas) search and insert one at a time.
+ALLOC_LOCK_KEY = "ipam:allocate"
+# Applied as the session lock_timeout of every pooled connection.
+ALLOC_LOCK_TIMEOUT = os.getenv("ALLOC_LOCK_TIMEOUT", "5s")
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "5"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "20"))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "10"))
 PRIMARY_POOL = ipaddress.IPv4Network("10.0.0.0/16")
 CGNAT_POOL = ipaddress.IPv4Network("100.64.0.0/10")
 
@@ -57,20 +72,30 @@ templates = Jinja2Templates(directory="templates")
 # -------------------------------------------------------------------
 REQ_ID = "X-Request-Id"
 
+# Random per-process prefix plus a counter: 32 hex digits, so the id is still
+# valid input for allocations.request_id (UUID), without a urandom call per request.
+_REQ_ID_PREFIX = secrets.token_hex(8)
+_REQ_COUNTER = itertools.count()
+
+def next_request_id() -> str:
+    return f"{_REQ_ID_PREFIX}{next(_REQ_COUNTER):016x}"
+
 @app.middleware("http")
 async def force_request_id(request: Request, call_next):
-    request_id = uuid.uuid4().hex
+    request_id = next_request_id()
     request.state.request_id = request_id
-    
-    # Log incoming requests
-    logger.info(f"Request {request_id}: {request.method} {request.url.path}")
-    
+    started = time.perf_counter()
+
     response = await call_next(request)
     response.headers[REQ_ID] = request_id
-    
-    # Log response status
-    logger.info(f"Request {request_id}: Response {response.status_code}")
-    
+
+    # one access line per request, written once the response is known
+    logger.info(
+        "Request %s: %s %s -> %s in %.1fms",
+        request_id, request.method, request.url.path, response.status_code,
+        (time.perf_counter() - started) * 1000,
+    )
+
     return response
 
 # -------------------------------------------------------------------
@@ -115,6 +140,9 @@ class AllocationRequest(BaseModel):
             ]
         }
 
+class BatchAllocationRequest(BaseModel):
+    items: List[AllocationRequest] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
 class ReassignRequest(BaseModel):
     new_vpc_name: str = Field(min_length=1)
 
@@ -136,14 +164,73 @@ async def http_exception_handler(request, exc: HTTPException):
 # -------------------------------------------------------------------
 # DB helpers
 # -------------------------------------------------------------------
+POOL: Optional[ThreadedConnectionPool] = None
+_POOL_INIT_LOCK = threading.Lock()
+
+def init_pool() -> ThreadedConnectionPool:
+    global POOL
+    with _POOL_INIT_LOCK:
+        if POOL is None:
+            POOL = ThreadedConnectionPool(
+                minconn=PG_POOL_MIN,
+                maxconn=PG_POOL_MAX,
+                dsn=DB_DSN,
+                # session settings ride along with the connection handshake
+                options=f"-c lock_timeout={ALLOC_LOCK_TIMEOUT}",
+                cursor_factory=psycopg2.extras.RealDictCursor,
+            )
+            logger.info(f"Database pool ready (min={PG_POOL_MIN}, max={PG_POOL_MAX})")
+    return POOL
+
+# Sync handlers run in FastAPI's threadpool, which is larger than the DB pool.
+# ThreadedConnectionPool raises as soon as it is empty, so threads queue here instead.
+POOL_SLOTS = threading.BoundedSemaphore(PG_POOL_MAX)
+
+@contextmanager
 def db():
+    if not POOL_SLOTS.acquire(timeout=PG_POOL_TIMEOUT):
+        logger.error(f"No database connection available after {PG_POOL_TIMEOUT}s")
+        raise HTTPException(503, {"code": "DB_POOL_EXHAUSTED", "message": "Database busy", "details": None})
     try:
-        conn = psycopg2.connect(DB_DSN)
-        conn.cursor_factory = psycopg2.extras.RealDictCursor
-        return conn
-    except psycopg2.Error as e:
-        logger.error(f"Database connection failed: {e}")
-        raise HTTPException(500, {"code": "DB_CONNECTION_ERROR", "message": "Database unavailable", "details": str(e)})
+        try:
+            pool = init_pool()
+            conn = pool.getconn()
+        except psycopg2.Error as e:
+            logger.error(f"Database connection failed: {e}")
+            raise HTTPException(500, {"code": "DB_CONNECTION_ERROR", "message": "Database unavailable", "details": str(e)})
+        try:
+            # commits on success, rolls back on exception
+            with conn:
+                yield conn
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        POOL_SLOTS.release()
+
+def get_or_create_vpc_id(cur, name: str) -> int:
+    # VPCs almost always exist already, so look up before paying for an upsert
+    cur.execute("SELECT id FROM vpcs WHERE name=%s", (name,))
+    row = cur.fetchone()
+    if row:
+        return row["id"]
+    cur.execute("INSERT INTO vpcs(name) VALUES(%s) ON CONFLICT DO NOTHING RETURNING id", (name,))
+    row = cur.fetchone()
+    if row:
+        logger.info(f"Created VPC '{name}'")
+        return row["id"]
+    # lost a race with a concurrent insert of the same name
+    cur.execute("SELECT id FROM vpcs WHERE name=%s", (name,))
+    return cur.fetchone()["id"]
+
+# Set by ensure_constraints() once the generated usable_* columns are confirmed
+USABLE_COLUMNS = False
+
+def usable_select() -> Tuple[str, str]:
+    """Select-list expressions for usable_primary/usable_cgnat in listing queries"""
+    if USABLE_COLUMNS:
+        return "a.usable_primary", "a.usable_cgnat"
+    return ("(1::bigint << (32 - masklen(a.primary_cidr))) - 5 AS usable_primary",
+            "(1::bigint << (32 - masklen(a.cgnat_cidr))) - 5 AS usable_cgnat")
 
 def ensure_constraints():
     ddl = """
@@ -155,6 +242,30 @@ def ensure_constraints():
         IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname='allocations_cgnat_unique') THEN
             ALTER TABLE allocations ADD CONSTRAINT allocations_cgnat_unique UNIQUE (cgnat_cidr);
         END IF;
+        -- The no_overlap_* exclusion constraints from init.sql already carry GiST indexes;
+        -- older databases without them need one for the <<= pool scans.
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname='no_overlap_primary') THEN
+            CREATE INDEX IF NOT EXISTS allocations_primary_gist ON allocations USING gist (primary_cidr inet_ops);
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname='no_overlap_cgnat') THEN
+            CREATE INDEX IF NOT EXISTS allocations_cgnat_gist ON allocations USING gist (cgnat_cidr inet_ops);
+        END IF;
+        -- Usable sizes are stored on the row instead of recomputed per listing.
+        -- Checked first: ALTER TABLE locks the table even when the column exists.
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_schema=current_schema() AND table_name='allocations' AND column_name='usable_primary') THEN
+            ALTER TABLE allocations ADD COLUMN usable_primary BIGINT
+                GENERATED ALWAYS AS ((1::bigint << (32 - masklen(primary_cidr))) - 5) STORED;
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_schema=current_schema() AND table_name='allocations' AND column_name='usable_cgnat') THEN
+            ALTER TABLE allocations ADD COLUMN usable_cgnat BIGINT
+                GENERATED ALWAYS AS ((1::bigint << (32 - masklen(cgnat_cidr))) - 5) STORED;
+        END IF;
+        -- Per-VPC listing reads allocations in primary_cidr order straight off this index
+        IF to_regclass('ix_alloc_vpc_primary') IS NULL THEN
+            CREATE INDEX ix_alloc_vpc_primary ON allocations (vpc_id, primary_cidr);
+        END IF;
     END$$;
     """
     try:
@@ -164,89 +275,141 @@ def ensure_constraints():
     except Exception as e:
         logger.error(f"Failed to ensure database constraints: {e}")
 
+    # Listings read the stored usable_* columns only once they are known to exist
+    global USABLE_COLUMNS
+    try:
+        with db() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT COUNT(*) AS c FROM information_schema.columns
+                WHERE table_schema=current_schema() AND table_name='allocations'
+                  AND column_name IN ('usable_primary', 'usable_cgnat')
+                """
+            )
+            USABLE_COLUMNS = cur.fetchone()["c"] == 2
+    except Exception as e:
+        logger.error(f"Failed to check for usable_* columns: {e}")
+        USABLE_COLUMNS = False
+    if not USABLE_COLUMNS:
+        logger.warning("allocations.usable_* columns missing; listings compute usable sizes per row")
+
 @app.on_event("startup")
 def _startup():
     logger.info("Starting IPAM API service")
     try:
+        init_pool()
         ensure_constraints()
         logger.info("IPAM API startup completed successfully")
     except Exception as e:
         logger.error(f"Startup failed: {e}")
 
+@app.on_event("shutdown")
+def _shutdown():
+    if POOL is not None:
+        POOL.closeall()
+        logger.info("Database pool closed")
+
 # -------------------------------------------------------------------
 # Sizing (CGNAT Range is always /5 larger than primary for 1:32 Node to Pod Relationship)
 # -------------------------------------------------------------------
+@lru_cache(maxsize=4096)
 def hosts_to_prefix_length(hosts: int) -> int:
-    needed_addresses = hosts + 5  # policy reserve
-    host_bits = math.ceil(math.log2(max(needed_addresses, 1)))
-    prefix_length = 32 - host_bits
-    result = max(20, min(26, prefix_length))
-    logger.debug(f"Calculated prefix /{result} for {hosts} hosts")
+    # ceil(log2(hosts + 5)) for the 5-address policy reserve, no floats
+    host_bits = (hosts + 4).bit_length()
+    result = max(20, min(26, 32 - host_bits))
+    logger.debug("Calculated prefix /%s for %s hosts", result, hosts)
     return result
 
+# Usable addresses per prefix length (total - 5 reserved), indexed by prefix
+USABLE = tuple(max(0, (1 << (32 - p)) - 5) for p in range(33))
+
 def usable_count(prefix_len: int) -> int:
-    return (2 ** (32 - prefix_len)) - 5
+    return USABLE[prefix_len]
 
 # -------------------------------------------------------------------
-# Overlap checks
+# Free-block search
 # -------------------------------------------------------------------
-CHECK_OVERLAP_SQL = """
-SELECT {column}::text AS cidr
+# First and last address of each allocation in the pool, as integers
+POOL_OCCUPIED_SQL = """
+SELECT network({column}) - '0.0.0.0'::inet AS lo,
+       broadcast({column}) - '0.0.0.0'::inet AS hi
 FROM {table}
-WHERE {column} && %s::cidr
-LIMIT %s
+WHERE {column} <<= %s::cidr
 """
 
-def find_overlaps(cur, table: str, column: str, candidate_cidr: str, limit: int = 20) -> List[str]:
-    q = sql.SQL(CHECK_OVERLAP_SQL).format(table=sql.Identifier(table), column=sql.Identifier(column))
-    cur.execute(q, (candidate_cidr, limit))
-    rows = cur.fetchall()
-    overlaps = [r["cidr"] for r in rows]
-    if overlaps:
-        logger.debug(f"Found {len(overlaps)} overlaps for {candidate_cidr} in {table}.{column}")
-    return overlaps
-
-def subnet_is_free(cur, table: str, column: str, candidate_cidr: str) -> bool:
-    q = sql.SQL("SELECT 1 FROM {t} WHERE {c} && %s::cidr LIMIT 1").format(t=sql.Identifier(table), c=sql.Identifier(column))
-    cur.execute(q, (candidate_cidr,))
-    is_free = cur.fetchone() is None
-    logger.debug(f"Subnet {candidate_cidr} is {'free' if is_free else 'occupied'} in {table}.{column}")
-    return is_free
-
-def next_free_in_pool(cur, pool: ipaddress.IPv4Network, prefix_len: int, table: str, column: str) -> Tuple[str, List[str]]:
-    logger.debug(f"Searching for free /{prefix_len} subnet in {pool}")
-    start = int(pool.network_address)
+# (table, column) pairs the allocator searches; statements are composed once at import
+POOL_COLUMNS = (("allocations", "primary_cidr"), ("allocations", "cgnat_cidr"))
+
+def _compose(template: str) -> Dict[Tuple[str, str], sql.Composed]:
+    return {
+        (table, column): sql.SQL(template).format(table=sql.Identifier(table), column=sql.Identifier(column))
+        for table, column in POOL_COLUMNS
+    }
+
+_OCCUPIED_SQL = _compose(POOL_OCCUPIED_SQL)
+
+def int_to_cidr(address: int, prefix_len: int) -> str:
+    # same text as str(IPv4Network((address, prefix_len))) without building the object
+    return socket.inet_ntoa(struct.pack(">I", address)) + "/" + str(prefix_len)
+
+def occupied_ranges(cur, pool: ipaddress.IPv4Network, table: str, column: str) -> List[Tuple[int, int]]:
+    cur.execute(_OCCUPIED_SQL[(table, column)], (str(pool),))
+    return [(row["lo"], row["hi"]) for row in cur.fetchall()]
+
+def occupancy_bitmap(pool: ipaddress.IPv4Network, prefix_len: int, ranges: List[Tuple[int, int]]) -> bytearray:
+    """One byte per aligned /prefix_len block of the pool; non-zero where a range covers it."""
     step = 2 ** (32 - prefix_len)
-    pool_end = int(pool.broadcast_address)
-    current = start
-    mod = current % step
-    if mod != 0:
-        current += (step - mod)
-        
-    candidates_checked = 0
-    while current + step - 1 <= pool_end:
-        candidate = ipaddress.IPv4Network((current, prefix_len))
-        candidates_checked += 1
-        
-        if candidate.subnet_of(pool):
-            cidr = str(candidate)
-            if subnet_is_free(cur, table, column, cidr):
-                logger.info(f"Found free subnet {cidr} after checking {candidates_checked} candidates")
-                return cidr, []
-        current += step
-        
-        # Log progress for long searches
-        if candidates_checked % 100 == 0:
-            logger.debug(f"Checked {candidates_checked} candidates, still searching...")
-    
-    logger.warning(f"No free /{prefix_len} subnets found in {pool} after checking {candidates_checked} candidates")
+    base = int(pool.network_address)
+    blocks = bytearray(pool.num_addresses // step)
+    for lo, hi in ranges:
+        first = (lo - base) // step
+        last = (hi - base) // step
+        blocks[first:last + 1] = b"\x01" * (last - first + 1)
+    return blocks
+
+def next_free_in_pool(
+    cur,
+    pool: ipaddress.IPv4Network,
+    prefix_len: int,
+    table: str,
+    column: str,
+    taken: Optional[Dict[str, List[Tuple[int, int]]]] = None,
+) -> Tuple[str, List[str]]:
+    """First free /prefix_len block in pool.
+
+    `taken` lets several searches in one transaction share a single read of the
+    occupied ranges (keyed by column); each search appends the block it picks.
+    """
+    logger.debug("Searching for free /%s subnet in %s", prefix_len, pool)
+    # Rebuilt per search rather than cached in-process: other API replicas allocate
+    # too, and the allocation advisory lock makes this snapshot current.
+    if taken is None:
+        ranges = occupied_ranges(cur, pool, table, column)
+    else:
+        if column not in taken:
+            taken[column] = occupied_ranges(cur, pool, table, column)
+        ranges = taken[column]
+    blocks = occupancy_bitmap(pool, prefix_len, ranges)
+    idx = blocks.find(0)
+    if idx >= 0:
+        step = 2 ** (32 - prefix_len)
+        start = int(pool.network_address) + idx * step
+        cidr = int_to_cidr(start, prefix_len)
+        if taken is not None:
+            ranges.append((start, start + step - 1))
+        logger.info(f"Found free subnet {cidr} at block {idx} of {len(blocks)}")
+        return cidr, []
+
+    logger.warning(f"No free /{prefix_len} subnets found in {pool} ({len(blocks)} blocks occupied)")
     return "", ["no_free_block"]
 
-def find_next_available_subnets_tx(cur, prefix_length: int) -> Tuple[str, str, int, Dict[str, List[str]]]:
+def find_next_available_subnets_tx(
+    cur, prefix_length: int, taken: Optional[Dict[str, List[Tuple[int, int]]]] = None
+) -> Tuple[str, str, int, Dict[str, List[str]]]:
     logger.info(f"Finding available subnets for /{prefix_length}")
     diag: Dict[str, List[str]] = {}
     
-    primary_cidr, _ = next_free_in_pool(cur, PRIMARY_POOL, prefix_length, "allocations", "primary_cidr")
+    primary_cidr, _ = next_free_in_pool(cur, PRIMARY_POOL, prefix_length, "allocations", "primary_cidr", taken)
     if not primary_cidr:
         diag["primary_conflicts"] = ["exhausted"]
         logger.error(f"No available /{prefix_length} in {PRIMARY_POOL.with_prefixlen}")
@@ -257,7 +420,7 @@ def find_next_available_subnets_tx(cur, prefix_length: int) -> Tuple[str, str, i
         logger.error(f"Invalid CGNAT prefix calculation: {prefix_length} - 5 = {cgnat_prefix}")
         raise HTTPException(status_code=400, detail={"code": "BAD_POLICY", "message": "Computed CGNAT prefix invalid", "details": None})
     
-    cgnat_cidr, _ = next_free_in_pool(cur, CGNAT_POOL, cgnat_prefix, "allocations", "cgnat_cidr")
+    cgnat_cidr, _ = next_free_in_pool(cur, CGNAT_POOL, cgnat_prefix, "allocations", "cgnat_cidr", taken)
     if not cgnat_cidr:
         diag["cgnat_conflicts"] = ["exhausted"]
         logger.error(f"No available /{cgnat_prefix} in {CGNAT_POOL.with_prefixlen}")
@@ -266,6 +429,64 @@ def find_next_available_subnets_tx(cur, prefix_length: int) -> Tuple[str, str, i
     logger.info(f"Successfully found subnets: primary={primary_cidr}, cgnat={cgnat_cidr}")
     return primary_cidr, cgnat_cidr, cgnat_prefix, diag
 
+def resolve_prefix_length(payload: AllocationRequest) -> int:
+    if payload.hosts is not None and payload.prefix_length is not None:
+        raise HTTPException(400, {"code": "BAD_REQUEST", "message": "Specify either 'hosts' or 'prefix_length', not both", "details": None})
+    if payload.hosts is None and payload.prefix_length is None:
+        raise HTTPException(400, {"code": "BAD_REQUEST", "message": "Must specify either 'hosts' or 'prefix_length'", "details": None})
+    if payload.hosts is not None:
+        if payload.hosts < 1 or payload.hosts > 4000:
+            raise HTTPException(400, {"code": "BAD_REQUEST", "message": "hosts must be between 1 and 4000", "details": None})
+        return hosts_to_prefix_length(payload.hosts)
+    return int(payload.prefix_length)
+
+def resolve_vpc_ids(cur, names: List[str]) -> Dict[str, int]:
+    """VPC ids for names, created as needed.
+
+    Resolved in a fixed (case-insensitive, matching citext) order so concurrent
+    batches creating the same new VPCs take their row locks in the same order.
+    """
+    vpc_ids: Dict[str, int] = {}
+    for name in sorted(set(names), key=lambda n: (n.lower(), n)):
+        vpc_ids[name] = get_or_create_vpc_id(cur, name)
+    return vpc_ids
+
+def batch_item_error(index: int, exc: HTTPException) -> HTTPException:
+    """Same error, with the failing batch item's (0-based) index in message and details"""
+    detail = dict(exc.detail)
+    detail["message"] = f"Item {index}: {detail['message']}"
+    detail["details"] = {"item": index, **(detail.get("details") or {})}
+    return HTTPException(exc.status_code, detail)
+
+def plan_batch(cur, planned: List[Tuple[AllocationRequest, int, Dict[str, str]]], vpc_ids: Dict[str, int]) -> Tuple[List[dict], List[tuple]]:
+    """Pick subnets for every batch item; returns (response items, insert rows).
+
+    Raises NO_SPACE, naming the item, before anything is inserted if any item cannot be placed.
+    """
+    # one read of each pool; later items see the blocks earlier items picked
+    taken: Dict[str, List[Tuple[int, int]]] = {}
+    results = []
+    rows = []
+    for index, (item, prefix_length, labels_json) in enumerate(planned):
+        try:
+            primary_cidr, cgnat_cidr, cgnat_prefix, _diag = find_next_available_subnets_tx(cur, prefix_length, taken)
+        except HTTPException as e:
+            raise batch_item_error(index, e) from e
+        results.append({
+            "vpc": item.vpc,
+            "primary_cidr": primary_cidr,
+            "cgnat_cidr": cgnat_cidr,
+            "primary_subnet_size": f"/{prefix_length}",
+            "cgnat_subnet_size": f"/{cgnat_prefix}",
+            "usable_primary": USABLE[prefix_length],
+            "usable_cgnat": USABLE[cgnat_prefix],
+            "requested_hosts": item.hosts,
+            "requested_prefix": item.prefix_length,
+            "labels": labels_json,
+        })
+        rows.append((vpc_ids[item.vpc], primary_cidr, cgnat_cidr, item.hosts, item.prefix_length, Json(labels_json)))
+    return results, rows
+
 # -------------------------------------------------------------------
 # Routes
 # -------------------------------------------------------------------
@@ -274,7 +495,7 @@ def dashboard(request: Request):
     return templates.TemplateResponse("dashboard.html", {"request": request})
 
 @app.get("/healthz")
-def healthz():
+async def healthz():
     return {"status": "ok", "timestamp": time.time()}
 
 @app.get("/readyz")
@@ -294,31 +515,21 @@ def allocate(req: Request, payload: AllocationRequest, dry_run: bool = Query(Fal
     request_id = req.state.request_id
     logger.info(f"Request {request_id}: Starting allocation for VPC '{payload.vpc}', hosts={payload.hosts}, prefix={payload.prefix_length}")
     
-    # input validation
-    if payload.hosts is not None and payload.prefix_length is not None:
-        raise HTTPException(400, {"code": "BAD_REQUEST", "message": "Specify either 'hosts' or 'prefix_length', not both", "details": None})
-    if payload.hosts is None and payload.prefix_length is None:
-        raise HTTPException(400, {"code": "BAD_REQUEST", "message": "Must specify either 'hosts' or 'prefix_length'", "details": None})
+    prefix_length = resolve_prefix_length(payload)
     labels_json = (payload.labels or Labels()).to_jsonb()
-
-    if payload.hosts is not None:
-        if payload.hosts < 1 or payload.hosts > 4000:
-            raise HTTPException(400, {"code": "BAD_REQUEST", "message": "hosts must be between 1 and 4000", "details": None})
-        prefix_length = hosts_to_prefix_length(payload.hosts)
-        logger.info(f"Request {request_id}: Calculated prefix length /{prefix_length} for {payload.hosts} hosts")
-    else:
-        prefix_length = int(payload.prefix_length)
-        logger.info(f"Request {request_id}: Using specified prefix length /{prefix_length}")
+    logger.info(f"Request {request_id}: Using prefix length /{prefix_length}")
 
     # transactional allocation with retries
     for attempt in range(1, MAX_RETRIES + 1):
-        logger.debug(f"Request {request_id}: Allocation attempt {attempt}/{MAX_RETRIES}")
+        logger.debug("Request %s: Allocation attempt %s/%s", request_id, attempt, MAX_RETRIES)
         try:
             with db() as conn:
-                conn.set_session(isolation_level="SERIALIZABLE", readonly=False, autocommit=False)
                 with conn.cursor() as cur:
                     # ensure vpc row
-                    cur.execute("INSERT INTO vpcs(name) VALUES(%s) ON CONFLICT DO NOTHING", (payload.vpc,))
+                    vpc_id = get_or_create_vpc_id(cur, payload.vpc)
+
+                    # serialize allocators; released on commit/rollback
+                    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (ALLOC_LOCK_KEY,))
 
                     # compute candidates
                     primary_cidr, cgnat_cidr, cgnat_prefix, _diag = find_next_available_subnets_tx(cur, prefix_length)
@@ -333,8 +544,8 @@ def allocate(req: Request, payload: AllocationRequest, dry_run: bool = Query(Fal
                             "cgnat_cidr": cgnat_cidr,
                             "primary_subnet_size": f"/{prefix_length}",
                             "cgnat_subnet_size": f"/{cgnat_prefix}",
-                            "usable_primary": usable_count(prefix_length),
-                            "usable_cgnat": usable_count(cgnat_prefix),
+                            "usable_primary": USABLE[prefix_length],
+                            "usable_cgnat": USABLE[cgnat_prefix],
                             "requested_hosts": payload.hosts,
                             "requested_prefix": payload.prefix_length,
                             "labels": labels_json,
@@ -346,16 +557,16 @@ def allocate(req: Request, payload: AllocationRequest, dry_run: bool = Query(Fal
                         INSERT INTO allocations
                           (vpc_id, primary_cidr, cgnat_cidr, requested_hosts, requested_prefix, labels, request_id)
                         VALUES
-                          ((SELECT id FROM vpcs WHERE name=%s), %s::cidr, %s::cidr, %s, %s, %s::jsonb, %s)
+                          (%s, %s::cidr, %s::cidr, %s, %s, %s, %s)
                         RETURNING id
                         """,
                         (
-                            payload.vpc,
+                            vpc_id,
                             primary_cidr,
                             cgnat_cidr,
                             payload.hosts,
                             payload.prefix_length,
-                            json.dumps(labels_json),
+                            Json(labels_json),
                             server_request_id,
                         ),
                     )
@@ -372,16 +583,16 @@ def allocate(req: Request, payload: AllocationRequest, dry_run: bool = Query(Fal
                 "cgnat_cidr": cgnat_cidr,
                 "primary_subnet_size": f"/{prefix_length}",
                 "cgnat_subnet_size": f"/{cgnat_prefix}",
-                "usable_primary": usable_count(prefix_length),
-                "usable_cgnat": usable_count(cgnat_prefix),
+                "usable_primary": USABLE[prefix_length],
+                "usable_cgnat": USABLE[cgnat_prefix],
                 "requested_hosts": payload.hosts,
                 "requested_prefix": payload.prefix_length,
                 "labels": labels_json,
                 "request_id": server_request_id,
             }
 
-        except (pg_errors.SerializationFailure, pg_errors.DeadlockDetected) as e:
-            logger.warning(f"Request {request_id}: Serialization/deadlock error on attempt {attempt}: {e}")
+        except pg_errors.LockNotAvailable as e:
+            logger.warning(f"Request {request_id}: Allocation lock timeout on attempt {attempt}: {e}")
             if attempt == MAX_RETRIES:
                 raise HTTPException(503, {"code": "RETRY_EXHAUSTED", "message": "Allocation contention", "details": None})
             time.sleep(0.05 * attempt)
@@ -400,39 +611,92 @@ def allocate(req: Request, payload: AllocationRequest, dry_run: bool = Query(Fal
 
     raise HTTPException(500, {"code": "INTERNAL_ERROR", "message": "Unexpected retry failure", "details": None})
 
+@app.post("/allocate/batch", dependencies=[Depends(verify_api_key)])
+def allocate_batch(req: Request, payload: BatchAllocationRequest):
+    request_id = req.state.request_id
+    logger.info(f"Request {request_id}: Starting batch allocation of {len(payload.items)} item(s)")
+
+    # validate everything up front so a bad item fails before any DB work
+    planned = []
+    for index, item in enumerate(payload.items):
+        try:
+            prefix_length = resolve_prefix_length(item)
+        except HTTPException as e:
+            raise batch_item_error(index, e) from e
+        planned.append((item, prefix_length, (item.labels or Labels()).to_jsonb()))
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        logger.debug("Request %s: Batch allocation attempt %s/%s", request_id, attempt, MAX_RETRIES)
+        try:
+            with db() as conn, conn.cursor() as cur:
+                vpc_ids = resolve_vpc_ids(cur, [item.vpc for item, _, _ in planned])
+
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (ALLOC_LOCK_KEY,))
+
+                results, rows = plan_batch(cur, planned, vpc_ids)
+
+                inserted = execute_values(
+                    cur,
+                    """
+                    INSERT INTO allocations
+                      (vpc_id, primary_cidr, cgnat_cidr, requested_hosts, requested_prefix, labels)
+                    VALUES %s
+                    RETURNING id, primary_cidr::text
+                    """,
+                    rows,
+                    template="(%s, %s::cidr, %s::cidr, %s, %s, %s)",
+                    page_size=MAX_BATCH_ITEMS,
+                    fetch=True,
+                )
+                ids = {r["primary_cidr"]: r["id"] for r in inserted}
+                for result in results:
+                    result["allocation_id"] = ids[result["primary_cidr"]]
+            logger.info(f"Request {request_id}: Successfully created {len(results)} allocation(s)")
+            return {"ok": True, "count": len(results), "items": results, "request_id": request_id}
+
+        except pg_errors.LockNotAvailable as e:
+            logger.warning(f"Request {request_id}: Allocation lock timeout on attempt {attempt}: {e}")
+            if attempt == MAX_RETRIES:
+                raise HTTPException(503, {"code": "RETRY_EXHAUSTED", "message": "Allocation contention", "details": None})
+            time.sleep(0.05 * attempt)
+            continue
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Request {request_id}: Unexpected error on attempt {attempt}: {e}")
+            raise HTTPException(500, {"code": "INTERNAL_ERROR", "message": "Internal error", "details": str(e)})
+
+    raise HTTPException(500, {"code": "INTERNAL_ERROR", "message": "Unexpected retry failure", "details": None})
+
 @app.get("/allocations", dependencies=[Depends(verify_api_key)])
 def list_allocations(
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
     vpc: Optional[str] = None,
 ):
+    usable_primary, usable_cgnat = usable_select()
     with db() as conn, conn.cursor() as cur:
-        if vpc:
-            cur.execute("SELECT COUNT(*) AS c FROM allocations a JOIN vpcs v ON a.vpc_id=v.id WHERE v.name=%s", (vpc,))
-        else:
-            cur.execute("SELECT COUNT(*) AS c FROM allocations")
-        total = int(cur.fetchone()["c"])
-
         if vpc:
             cur.execute(
                 """
                 SELECT v.name AS vpc,
                        a.id AS allocation_id,
                        a.primary_cidr::text,
-                       (power(2, 32 - masklen(a.primary_cidr))::bigint - 5) AS usable_primary,
+                       {usable_primary},
                        a.cgnat_cidr::text,
-                       (power(2, 32 - masklen(a.cgnat_cidr))::bigint - 5) AS usable_cgnat,
+                       {usable_cgnat},
                        a.requested_hosts,
                        a.requested_prefix,
                        a.labels,
                        a.request_id::text,
-                       a.created_at
+                       a.created_at,
+                       COUNT(*) OVER () AS total_count
                 FROM allocations a
                 JOIN vpcs v ON a.vpc_id = v.id
                 WHERE v.name=%s
-                ORDER BY v.name, a.primary_cidr
+                ORDER BY a.primary_cidr
                 LIMIT %s OFFSET %s
-                """,
+                """.format(usable_primary=usable_primary, usable_cgnat=usable_cgnat),
                 (vpc, limit, offset),
             )
         else:
@@ -441,23 +705,38 @@ def list_allocations(
                 SELECT v.name AS vpc,
                        a.id AS allocation_id,
                        a.primary_cidr::text,
-                       (power(2, 32 - masklen(a.primary_cidr))::bigint - 5) AS usable_primary,
+                       {usable_primary},
                        a.cgnat_cidr::text,
-                       (power(2, 32 - masklen(a.cgnat_cidr))::bigint - 5) AS usable_cgnat,
+                       {usable_cgnat},
                        a.requested_hosts,
                        a.requested_prefix,
                        a.labels,
                        a.request_id::text,
-                       a.created_at
+                       a.created_at,
+                       COUNT(*) OVER () AS total_count
                 FROM allocations a
                 JOIN vpcs v ON a.vpc_id = v.id
                 ORDER BY v.name, a.primary_cidr
                 LIMIT %s OFFSET %s
-                """,
+                """.format(usable_primary=usable_primary, usable_cgnat=usable_cgnat),
                 (limit, offset),
             )
         rows = cur.fetchall()
+
+        if rows:
+            total = int(rows[0]["total_count"])
+        elif offset == 0:
+            total = 0
+        else:
+            # paged past the end: no row carries the window count
+            if vpc:
+                cur.execute("SELECT COUNT(*) AS c FROM allocations a JOIN vpcs v ON a.vpc_id=v.id WHERE v.name=%s", (vpc,))
+            else:
+                cur.execute("SELECT COUNT(*) AS c FROM allocations")
+            total = int(cur.fetchone()["c"])
+
         for r in rows:
+            del r["total_count"]
             if r["created_at"]:
                 r["created_at"] = r["created_at"].isoformat()
         return {"total_count": total, "limit": limit, "offset": offset, "items": rows}
@@ -470,15 +749,11 @@ def update_allocation_vpc(allocation_id: int, payload: ReassignRequest):
         raise HTTPException(400, {"code": "BAD_REQUEST", "message": "new_vpc_name is required", "details": None})
 
     with db() as conn, conn.cursor() as cur:
-        cur.execute("SELECT vpc_id FROM allocations WHERE id=%s", (allocation_id,))
-        allocation = cur.fetchone()
-        if not allocation:
+        vpc_id = get_or_create_vpc_id(cur, new_vpc_name)
+        cur.execute("UPDATE allocations SET vpc_id=%s WHERE id=%s RETURNING id", (vpc_id, allocation_id))
+        if cur.fetchone() is None:
+            # raising inside db() rolls back any VPC created above
             raise HTTPException(404, {"code": "NOT_FOUND", "message": f"Allocation {allocation_id} not found", "details": None})
-
-        cur.execute("INSERT INTO vpcs(name) VALUES(%s) ON CONFLICT DO NOTHING", (new_vpc_name,))
-        cur.execute("SELECT id FROM vpcs WHERE name=%s", (new_vpc_name,))
-        vpc_id = cur.fetchone()["id"]
-        cur.execute("UPDATE allocations SET vpc_id=%s WHERE id=%s", (vpc_id, allocation_id))
         logger.info(f"Moved allocation {allocation_id} to VPC '{new_vpc_name}'")
 
     return {"ok": True, "allocation_id": allocation_id, "new_vpc_name": new_vpc_name}
@@ -512,10 +787,11 @@ def calculate_subnet_info(hosts: int = None, prefix_length: int = None):
         if hosts < 1 or hosts > 4000:
             raise HTTPException(400, {"code": "BAD_REQUEST", "message": "hosts must be between 1 and 4000", "details": None})
         prefix_length = hosts_to_prefix_length(hosts)
+    elif prefix_length < 5 or prefix_length > 32:
+        # the CGNAT prefix (prefix_length - 5) must still be a valid IPv4 prefix
+        raise HTTPException(400, {"code": "BAD_REQUEST", "message": "prefix_length must be between 5 and 32", "details": None})
 
     cgnat_prefix = prefix_length - 5
-    if cgnat_prefix < 0:
-        raise HTTPException(400, {"code": "BAD_POLICY", "message": "Computed CGNAT prefix invalid", "details": None})
 
     return {
         "requested_hosts": hosts,
@@ -523,8 +799,8 @@ def calculate_subnet_info(hosts: int = None, prefix_length: int = None):
         "calculated_prefix": prefix_length,
         "primary_subnet_size": f"/{prefix_length}",
         "cgnat_subnet_size": f"/{cgnat_prefix}",
-        "usable_primary_ips": usable_count(prefix_length),
-        "usable_cgnat_ips": usable_count(cgnat_prefix),
+        "usable_primary_ips": USABLE[prefix_length],
+        "usable_cgnat_ips": USABLE[cgnat_prefix],
         "total_addresses_primary": 2 ** (32 - prefix_length),
         "total_addresses_cgnat": 2 ** (32 - cgnat_prefix),
     }
@@ -0,0 +1,4 @@
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "pure: no database or network; stub cursors at most (run alone with -m pure)"
+    )
@@ -18,6 +18,10 @@ CREATE TABLE IF NOT EXISTS allocations(
   request_id        UUID UNIQUE, -- idempotency key (NULL allowed, unique enforced when set)
   created_at        TIMESTAMPTZ DEFAULT now(),
 
+  -- Usable addresses after the 5-address policy reserve
+  usable_primary    BIGINT GENERATED ALWAYS AS ((1::bigint << (32 - masklen(primary_cidr))) - 5) STORED,
+  usable_cgnat      BIGINT GENERATED ALWAYS AS ((1::bigint << (32 - masklen(cgnat_cidr))) - 5) STORED,
+
   -- Keep each CIDR in its pool
   CONSTRAINT in_primary CHECK (primary_cidr <<= '10.0.0.0/16'::cidr),
   CONSTRAINT in_cgnat   CHECK (cgnat_cidr   <<= '100.64.0.0/10'::cidr),
@@ -58,6 +62,7 @@ CREATE INDEX IF NOT EXISTS ix_alloc_labels ON allocations USING GIN (labels);
 
 -- Helpful lookups
 CREATE INDEX IF NOT EXISTS ix_alloc_vpc_created ON allocations (vpc_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS ix_alloc_vpc_primary ON allocations (vpc_id, primary_cidr);
 
 -- Insert some demo data for testing
 INSERT INTO vpcs (name) VALUES 
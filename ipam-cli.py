@@ -4,46 +4,139 @@ IPAM CLI Tool - Simple command line interface for the IPAM API
 Usage: python ipam_cli.py [command] [options]
 """
 import argparse
-import json
+import atexit
+import os
 import sys
-import requests
 from typing import Optional
 
+# requests, orjson/json and concurrent.futures are imported where they are first needed,
+# so `--help` and argument errors don't pay for loading the HTTP stack.
+
+def _json_codec():
+    """(loads, dumps) for request/response bodies; orjson when installed, stdlib json otherwise"""
+    try:
+        import orjson
+        return orjson.loads, orjson.dumps
+    except ImportError:
+        import json
+        return json.loads, lambda obj: json.dumps(obj).encode()
+
+# values the server accepts for the environment label
+ENV_CHOICES = ('dev', 'stage', 'prod')
+
+# server-side cap on items per /allocate/batch request
+BATCH_CHUNK_SIZE = 100
+
+CALC_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'ipam-cli', 'calculate.json')
+# Bump when /calculate answers change; files written under another version are discarded.
+# 2: /30 and smaller report 0 usable addresses instead of negative counts.
+CALC_CACHE_VERSION = 2
+# Entries also expire, so a server upgrade the CLI doesn't know about is picked up within a day
+CALC_CACHE_TTL = 24 * 60 * 60
+
+class IPAMError(Exception):
+    """API call failed; carries the HTTP status and error body when available"""
+    def __init__(self, message: str, status_code: Optional[int] = None, details=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
 class IPAMClient:
-    def __init__(self, base_url: str, api_key: str):
+    def __init__(self, base_url: str, api_key: str, pool_size: int = 32,
+                 timeout: tuple = (5.0, 10.0), write_timeout: float = 120.0,
+                 cache_path: Optional[str] = None):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
+        self.timeout = timeout  # (connect, read) seconds for GET/DELETE
+        # POSTs may queue for a DB connection and the allocation lock across several
+        # server-side retries (~40s worst case), so they get a much longer read limit.
+        self.write_timeout = write_timeout
+        self.cache_path = cache_path  # on-disk cache for deterministic GETs; None disables it
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        self._requests = requests
+        self._loads, self._dumps = _json_codec()
         self.session = requests.Session()
         self.session.headers.update({
             'X-API-Key': api_key,
             'Content-Type': 'application/json'
         })
+        # Keep connections alive across calls. Only reads are retried: a retried POST
+        # could double-allocate, and a retried DELETE that already committed would
+        # report 404. The last 5xx response is returned so its error body reaches the user.
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(['GET']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
-    def _request(self, method: str, endpoint: str, data: dict = None) -> dict:
+    def _request(self, method: str, endpoint: str, data: dict = None, params: dict = None) -> dict:
         url = f"{self.base_url}{endpoint}"
+        body = self._dumps(data) if data is not None else None
+        is_write = method not in ('GET', 'DELETE')
+        timeout = (self.timeout[0], self.write_timeout) if is_write else self.timeout
+        try:
+            response = self.session.request(method, url, data=body, params=params, timeout=timeout)
+        except self._requests.exceptions.ReadTimeout as e:
+            if is_write:
+                raise IPAMError(f"No response to {method} {endpoint} within {self.write_timeout:g}s; "
+                                "the change may still have been applied. Run 'list' before retrying.") from e
+            raise IPAMError(str(e)) from e
+        except self._requests.exceptions.RequestException as e:
+            raise IPAMError(str(e)) from e
+
+        if response.status_code < 400:
+            return self._loads(response.content)
         try:
-            response = self.session.request(method, url, json=data)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error: {e}")
-            if hasattr(e.response, 'json'):
-                try:
-                    error_detail = e.response.json()
-                    print(f"Details: {error_detail}")
-                except:
-                    pass
-            sys.exit(1)
+            details = self._loads(response.content) if response.content else None
+        except ValueError:
+            details = None
+        raise IPAMError(f"{response.status_code} {response.reason} for {method} {endpoint}",
+                        response.status_code, details)
+
+    def close(self):
+        """Release the pooled connections"""
+        self.session.close()
+
+    def _cached_get(self, endpoint: str, params: dict = None) -> dict:
+        """GET through the on-disk cache; only for responses that change just with server upgrades"""
+        if not self.cache_path:
+            return self._request('GET', endpoint, params=params)
+        import json
+        import time
+        # keyed by the full URL requests would send, query string included
+        key = self._requests.Request('GET', f"{self.base_url}{endpoint}", params=params).prepare().url
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        if not isinstance(cache, dict) or cache.get('version') != CALC_CACHE_VERSION:
+            cache = {'version': CALC_CACHE_VERSION, 'entries': {}}
+        entries = cache['entries']
+        now = time.time()
+        entry = entries.get(key)
+        if entry is None or now - entry['at'] > CALC_CACHE_TTL:
+            entry = entries[key] = {'at': now, 'result': self._request('GET', endpoint, params=params)}
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_path)
+        return entry['result']
 
     def create_vpc(self, name: str) -> dict:
         """Create a new VPC"""
         return self._request('POST', '/vpcs', {'name': name})
 
-    def allocate(self, vpc: str, hosts: Optional[int] = None, 
-                prefix_length: Optional[int] = None, 
-                environment: Optional[str] = None,
-                region: Optional[str] = None) -> dict:
-        """Create a new allocation"""
+    @staticmethod
+    def allocation_body(vpc: str, hosts: Optional[int] = None,
+                        prefix_length: Optional[int] = None,
+                        environment: Optional[str] = None,
+                        region: Optional[str] = None) -> dict:
+        """Build the JSON body for one allocation request"""
         data = {'vpc': vpc}
         
         if hosts is not None:
@@ -60,14 +153,31 @@ class IPAMClient:
             if region:
                 data['labels']['region'] = region
 
+        return data
+
+    def allocate(self, vpc: str, hosts: Optional[int] = None, 
+                prefix_length: Optional[int] = None, 
+                environment: Optional[str] = None,
+                region: Optional[str] = None) -> dict:
+        """Create a new allocation"""
+        data = self.allocation_body(vpc, hosts, prefix_length, environment, region)
         return self._request('POST', '/allocate', data)
 
+    def allocate_batch(self, items: list) -> list:
+        """Create several allocations in one request; the server commits all or none"""
+        return self._request('POST', '/allocate/batch', {'items': items})['items']
+
     def list_allocations(self, vpc: Optional[str] = None, limit: int = 50) -> dict:
         """List allocations"""
-        params = f"?limit={limit}"
+        params = {'limit': limit}
         if vpc:
-            params += f"&vpc={vpc}"
-        return self._request('GET', f'/allocations{params}')
+            params['vpc'] = vpc
+        result = self._request('GET', '/allocations', params=params)
+        # labels may come back JSON-encoded; hand callers a dict either way
+        for alloc in result['items']:
+            if isinstance(alloc.get('labels'), str):
+                alloc['labels'] = self._loads(alloc['labels'])
+        return result
 
     def delete_allocation(self, allocation_id: int) -> dict:
         """Delete an allocation"""
@@ -76,63 +186,203 @@ class IPAMClient:
     def calculate(self, hosts: Optional[int] = None, 
                  prefix_length: Optional[int] = None) -> dict:
         """Calculate subnet information"""
-        params = []
         if hosts is not None:
-            params.append(f"hosts={hosts}")
+            params = {'hosts': hosts}
         elif prefix_length is not None:
-            params.append(f"prefix_length={prefix_length}")
+            params = {'prefix_length': prefix_length}
         else:
             raise ValueError("Must specify either hosts or prefix_length")
-            
-        query_string = "?" + "&".join(params)
-        return self._request('GET', f'/calculate{query_string}')
 
-def main():
-    parser = argparse.ArgumentParser(description='IPAM CLI Tool')
-    parser.add_argument('--url', default='http://localhost:8000', 
-                       help='IPAM API base URL')
-    parser.add_argument('--api-key', required=True,
-                       help='API key for authentication')
-    
-    subparsers = parser.add_subparsers(dest='command', help='Available commands')
-    
-    # VPC commands
+        return self._cached_get('/calculate', params)
+
+# Clients shared within the process, so repeated calls from Python reuse one pooled session
+_CLIENTS = {}
+
+def get_client(base_url: str, api_key: str, **options) -> IPAMClient:
+    """Shared IPAMClient for (base_url, api_key); options are IPAMClient keyword arguments"""
+    key = (base_url.rstrip('/'), api_key, tuple(sorted(options.items())))
+    client = _CLIENTS.get(key)
+    if client is None:
+        client = _CLIENTS[key] = IPAMClient(base_url, api_key, **options)
+    return client
+
+@atexit.register
+def _close_clients():
+    for client in _CLIENTS.values():
+        client.close()
+    _CLIENTS.clear()
+
+def _describe_error(e: Exception) -> str:
+    """Error text for one failed batch record, with the server's error body when there is one"""
+    if isinstance(e, IPAMError) and e.details:
+        return f"{e} - {e.details}"
+    return str(e)
+
+def _item_args(item: dict) -> dict:
+    """Map a batch file record onto IPAMClient.allocate keyword arguments"""
+    return {
+        'vpc': item['vpc'],
+        'hosts': item.get('hosts'),
+        'prefix_length': item.get('prefix'),
+        'environment': item.get('env'),
+        'region': item.get('region'),
+    }
+
+def _allocate_item(client: IPAMClient, item: dict) -> dict:
+    return client.allocate(**_item_args(item))
+
+def run_batch(client: IPAMClient, items: list, concurrency: int) -> int:
+    """Allocate items concurrently over the client's pooled session; returns the failure count"""
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    failures = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(_allocate_item, client, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                result = future.result()
+                print(f"{item['vpc']}: {result['primary_cidr']} / {result['cgnat_cidr']}")
+            except (IPAMError, KeyError, ValueError) as e:
+                failures += 1
+                print(f"{item.get('vpc')}: failed - {_describe_error(e)}")
+    return failures
+
+def run_batch_endpoint(client: IPAMClient, items: list) -> Optional[int]:
+    """Allocate items through /allocate/batch, BATCH_CHUNK_SIZE per request; returns the failure count.
+
+    Returns None, with nothing allocated, when the server has no batch endpoint.
+    """
+    bodies = [IPAMClient.allocation_body(**_item_args(item)) for item in items]
+    failures = 0
+    for start in range(0, len(bodies), BATCH_CHUNK_SIZE):
+        chunk = bodies[start:start + BATCH_CHUNK_SIZE]
+        try:
+            results = client.allocate_batch(chunk)
+        except IPAMError as e:
+            if start == 0 and e.status_code in (404, 405):
+                return None
+            failures += len(chunk)
+            print(f"items {start + 1}-{start + len(chunk)}: failed - {_describe_error(e)}")
+            continue
+        for result in results:
+            print(f"{result['vpc']}: {result['primary_cidr']} / {result['cgnat_cidr']}")
+    return failures
+
+# Subcommand parsers, built on demand by main()
+def _add_create_vpc(subparsers):
     vpc_parser = subparsers.add_parser('create-vpc', help='Create a new VPC')
     vpc_parser.add_argument('name', help='VPC name')
-    
-    # Allocation commands
+
+def _add_allocate(subparsers):
     alloc_parser = subparsers.add_parser('allocate', help='Create allocation')
     alloc_parser.add_argument('vpc', help='VPC name')
     alloc_group = alloc_parser.add_mutually_exclusive_group(required=True)
     alloc_group.add_argument('--hosts', type=int, help='Number of hosts needed')
     alloc_group.add_argument('--prefix', type=int, help='Prefix length (/20-/26)')
-    alloc_parser.add_argument('--env', choices=['dev', 'stage', 'prod'],
+    alloc_parser.add_argument('--env', choices=ENV_CHOICES,
                              help='Environment label')
     alloc_parser.add_argument('--region', help='Region label')
-    
-    # List commands
+
+def _add_list(subparsers):
     list_parser = subparsers.add_parser('list', help='List allocations')
     list_parser.add_argument('--vpc', help='Filter by VPC name')
     list_parser.add_argument('--limit', type=int, default=50, 
                             help='Maximum results')
-    
-    # Delete commands  
+
+def _add_delete(subparsers):
     delete_parser = subparsers.add_parser('delete', help='Delete allocation')
     delete_parser.add_argument('allocation_id', type=int, help='Allocation ID')
-    
-    # Calculate commands
+
+def _add_calculate(subparsers):
     calc_parser = subparsers.add_parser('calculate', help='Calculate subnet info')
     calc_group = calc_parser.add_mutually_exclusive_group(required=True)
     calc_group.add_argument('--hosts', type=int, help='Number of hosts')
     calc_group.add_argument('--prefix', type=int, help='Prefix length')
+
+def _add_batch(subparsers):
+    batch_parser = subparsers.add_parser('batch', help='Create many allocations from a JSON file')
+    batch_parser.add_argument('--file', required=True,
+                              help='JSON list of {"vpc", "hosts" | "prefix", "env", "region"} records')
+    batch_parser.add_argument('--concurrency', type=int, default=16,
+                              help='Requests in flight at once when the server has no batch endpoint')
+
+COMMANDS = {
+    'create-vpc': _add_create_vpc,
+    'allocate': _add_allocate,
+    'list': _add_list,
+    'delete': _add_delete,
+    'calculate': _add_calculate,
+    'batch': _add_batch,
+}
+
+# top-level options whose value is the next argv token
+VALUE_OPTIONS = ('--url', '--api-key')
+
+def _requested_command(argv: list) -> Optional[str]:
+    """Subcommand named on the command line, or None when it can't be told cheaply"""
+    skip_value = False
+    for arg in argv:
+        if skip_value:
+            skip_value = False
+        elif arg in ('-h', '--help'):
+            return None
+        elif arg.startswith('--') and '=' not in arg and any(opt.startswith(arg) for opt in VALUE_OPTIONS):
+            skip_value = True  # also covers argparse's abbreviations, e.g. --api
+        elif not arg.startswith('-'):
+            return arg if arg in COMMANDS else None
+    return None
+
+class _LazyParseError(Exception):
+    pass
+
+class _LazyArgumentParser(argparse.ArgumentParser):
+    """Parser for the single-command fast path; its errors are re-reported by the full parser"""
+    def error(self, message):
+        raise _LazyParseError(message)
+
+def build_parser(command: Optional[str] = None, parser_class=argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """CLI parser with only `command`'s subparser, or every subparser when command is None"""
+    parser = parser_class(description='IPAM CLI Tool')
+    parser.add_argument('--url', default='http://localhost:8000', 
+                       help='IPAM API base URL')
+    parser.add_argument('--api-key', required=True,
+                       help='API key for authentication')
+    parser.add_argument('--cache', action='store_true',
+                       help=f'Reuse calculate results cached in {CALC_CACHE_PATH} for up to a day '
+                            f'(rm {CALC_CACHE_PATH} to clear it)')
     
-    args = parser.parse_args()
+    subparsers = parser.add_subparsers(dest='command', help='Available commands')
+    for name, add_command in COMMANDS.items():
+        if command is None or name == command:
+            add_command(subparsers)
+    return parser
+
+def parse_args(argv: list):
+    """(parser, args) for argv; usage errors and help always come from the full parser"""
+    # Only the invoked command's parser is built; help, unknown input and
+    # usage errors fall through to the full parser so output lists every command.
+    command = _requested_command(argv)
+    if command is not None:
+        parser = build_parser(command, _LazyArgumentParser)
+        try:
+            return parser, parser.parse_args(argv)
+        except _LazyParseError:
+            pass
+    parser = build_parser()
+    return parser, parser.parse_args(argv)
+
+def main():
+    parser, args = parse_args(sys.argv[1:])
     
     if not args.command:
         parser.print_help()
         return
     
-    client = IPAMClient(args.url, args.api_key)
+    cache_path = CALC_CACHE_PATH if args.cache else None
+    if args.command == 'batch':
+        client = get_client(args.url, args.api_key, pool_size=max(32, args.concurrency), cache_path=cache_path)
+    else:
+        client = get_client(args.url, args.api_key, cache_path=cache_path)
     
     try:
         if args.command == 'create-vpc':
@@ -155,17 +405,18 @@ def main():
         elif args.command == 'list':
             result = client.list_allocations(args.vpc, args.limit)
             allocations = result['items']
-            print(f"Found {result['total_count']} allocation(s)")
-            print()
+            # build the whole listing and write it once instead of several prints per row
+            lines = [f"Found {result['total_count']} allocation(s)\n\n"]
             for alloc in allocations:
-                print(f"ID: {alloc['allocation_id']} | VPC: {alloc['vpc']}")
-                print(f"  Primary: {alloc['primary_cidr']} ({alloc['usable_primary']:,} IPs)")
-                print(f"  CGNAT: {alloc['cgnat_cidr']} ({alloc['usable_cgnat']:,} IPs)")
+                lines.append(
+                    f"ID: {alloc['allocation_id']} | VPC: {alloc['vpc']}\n"
+                    f"  Primary: {alloc['primary_cidr']} ({alloc['usable_primary']:,} IPs)\n"
+                    f"  CGNAT: {alloc['cgnat_cidr']} ({alloc['usable_cgnat']:,} IPs)\n"
+                )
                 if alloc.get('labels'):
-                    labels = json.loads(alloc['labels']) if isinstance(alloc['labels'], str) else alloc['labels']
-                    if labels:
-                        print(f"  Labels: {labels}")
-                print()
+                    lines.append(f"  Labels: {alloc['labels']}\n")
+                lines.append("\n")
+            sys.stdout.write("".join(lines))
                 
         elif args.command == 'delete':
             result = client.delete_allocation(args.allocation_id)
@@ -178,7 +429,24 @@ def main():
                 print(f"  Requested hosts: {result['requested_hosts']}")
             print(f"  Primary subnet: {result['primary_subnet_size']} ({result['usable_primary_ips']:,} usable IPs)")
             print(f"  CGNAT subnet: {result['cgnat_subnet_size']} ({result['usable_cgnat_ips']:,} usable IPs)")
-            
+
+        elif args.command == 'batch':
+            import json
+            with open(args.file) as f:
+                items = json.load(f)
+            failures = run_batch_endpoint(client, items)
+            if failures is None:
+                # older server without /allocate/batch: one request per item
+                failures = run_batch(client, items, args.concurrency)
+            print(f"{len(items) - failures} of {len(items)} allocation(s) created")
+            if failures:
+                sys.exit(1)
+
+    except IPAMError as e:
+        print(f"Error: {e}")
+        if e.details:
+            print(f"Details: {e.details}")
+        sys.exit(1)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
@@ -1,7 +1,16 @@
 import pytest
+import contextlib
+import importlib.util
+import io
 import ipaddress
-from app import hosts_to_prefix_length, usable_count
+import os
+import uuid
+from fastapi import HTTPException
+from app import (PRIMARY_POOL, CGNAT_POOL, AllocationRequest, hosts_to_prefix_length, usable_count,
+                 calculate_subnet_info, int_to_cidr, next_free_in_pool, next_request_id,
+                 resolve_vpc_ids, plan_batch)
 
+@pytest.mark.pure
 def test_hosts_to_prefix_length():
     """Test subnet sizing calculation"""
     # Test cases based on your sizing logic
@@ -10,7 +19,14 @@ def test_hosts_to_prefix_length():
     assert hosts_to_prefix_length(500) == 23   # 500 + 5 = 505, needs 512 addresses = /23
     assert hosts_to_prefix_length(1000) == 22  # 1000 + 5 = 1005, needs 1024 addresses = /22
     assert hosts_to_prefix_length(4000) == 20  # 4000 + 5 = 4005, needs 4096 addresses = /20
+    # power-of-two boundaries: hosts + 5 exactly fills a block, then one more spills over
+    assert hosts_to_prefix_length(59) == 26    # 59 + 5 = 64 = /26
+    assert hosts_to_prefix_length(60) == 25    # 60 + 5 = 65, needs 128 = /25
+    assert hosts_to_prefix_length(123) == 25   # 123 + 5 = 128 = /25
+    assert hosts_to_prefix_length(124) == 24   # 124 + 5 = 129, needs 256 = /24
+    assert hosts_to_prefix_length(1) == 26     # 1 + 5 = 6, clamped up to /26
     
+@pytest.mark.pure
 def test_usable_count():
     """Test usable IP calculation (total - 5 reserved)"""
     assert usable_count(26) == 59    # 64 - 5
@@ -20,23 +36,64 @@ def test_usable_count():
     assert usable_count(22) == 1019  # 1024 - 5
     assert usable_count(21) == 2043  # 2048 - 5
     assert usable_count(20) == 4091  # 4096 - 5
+    # blocks smaller than the reserve have no usable addresses
+    assert usable_count(30) == 0
+    assert usable_count(32) == 0
 
+@pytest.mark.pure
+def test_calculate_rejects_out_of_range_prefix():
+    """Test /calculate answers 400 for prefixes outside /5-/32"""
+    for prefix in (4, 33, 40):
+        with pytest.raises(HTTPException) as exc:
+            calculate_subnet_info(prefix_length=prefix)
+        assert exc.value.status_code == 400
+        assert exc.value.detail["code"] == "BAD_REQUEST"
+    result = calculate_subnet_info(prefix_length=32)
+    assert result["cgnat_subnet_size"] == "/27"
+    assert result["usable_primary_ips"] == 0
+
+# Pool network addresses as integers: 10.0.0.0/16 and 100.64.0.0/10
+PRIMARY_INT, PRIMARY_PFX = 0x0A000000, 16
+CGNAT_INT, CGNAT_PFX = 0x64400000, 10
+
+def _as_int(cidr):
+    """(network address as int, prefix length) for a CIDR string"""
+    addr, prefix = cidr.split("/")
+    return int(ipaddress.IPv4Address(addr)), int(prefix)
+
+def contained(a_int, a_pfx, b_int, b_pfx):
+    """True when a/a_pfx sits inside b/b_pfx"""
+    return a_pfx >= b_pfx and (a_int >> (32 - b_pfx)) == (b_int >> (32 - b_pfx))
+
+def overlapping(a_int, a_pfx, b_int, b_pfx):
+    """True when the two address ranges share any address"""
+    a_end = a_int | (0xFFFFFFFF >> a_pfx)
+    b_end = b_int | (0xFFFFFFFF >> b_pfx)
+    return not (a_end < b_int or b_end < a_int)
+
+@pytest.mark.pure
 def test_cidr_pools():
     """Test that our pools are correctly defined"""
-    primary_pool = ipaddress.IPv4Network("10.0.0.0/16")
-    cgnat_pool = ipaddress.IPv4Network("100.64.0.0/10")
+    primary_pool = (PRIMARY_INT, PRIMARY_PFX)
+    cgnat_pool = (CGNAT_INT, CGNAT_PFX)
+    
+    # Test the integer constants describe the app's pools
+    assert primary_pool == (int(PRIMARY_POOL.network_address), PRIMARY_POOL.prefixlen)
+    assert cgnat_pool == (int(CGNAT_POOL.network_address), CGNAT_POOL.prefixlen)
     
     # Test primary pool contains expected subnets
-    test_primary = ipaddress.IPv4Network("10.0.1.0/24")
-    assert test_primary.subnet_of(primary_pool)
+    assert contained(*_as_int("10.0.1.0/24"), *primary_pool)
+    assert not contained(*_as_int("10.1.0.0/24"), *primary_pool)
     
     # Test CGNAT pool contains expected subnets  
-    test_cgnat = ipaddress.IPv4Network("100.64.0.0/19")
-    assert test_cgnat.subnet_of(cgnat_pool)
+    assert contained(*_as_int("100.64.0.0/19"), *cgnat_pool)
+    assert not contained(*_as_int("100.128.0.0/19"), *cgnat_pool)
     
     # Test pools don't overlap
-    assert not primary_pool.overlaps(cgnat_pool)
+    assert not overlapping(*primary_pool, *cgnat_pool)
+    assert overlapping(*_as_int("10.0.1.0/24"), *primary_pool)
 
+@pytest.mark.pure
 def test_cgnat_sizing_relationship():
     """Test that CGNAT is always /5 larger than primary"""
     primary_prefix = 24
@@ -48,10 +105,159 @@ def test_cgnat_sizing_relationship():
     cgnat_addresses = 2 ** (32 - cgnat_prefix)
     assert cgnat_addresses == primary_addresses * 32
 
+@pytest.mark.pure
+def test_int_to_cidr_matches_ipaddress():
+    """Test integer CIDR formatting matches ipaddress output"""
+    for pool, prefix in (("10.0.0.0/16", 20), ("10.0.0.0/16", 26), ("100.64.0.0/10", 15), ("100.64.0.0/10", 21)):
+        for net in ipaddress.IPv4Network(pool).subnets(new_prefix=prefix):
+            assert int_to_cidr(int(net.network_address), prefix) == str(net)
+
+class FakeCursor:
+    """Stands in for a DB cursor that returns fixed allocation rows"""
+    def __init__(self, cidrs):
+        self.nets = [ipaddress.IPv4Network(c) for c in cidrs]
+        self.pool = None
+        self.executed = []
+        self.vpc_ids = {}
+
+    def execute(self, query, params=None):
+        self.executed.append((str(query), params))
+        # pool scans pass the pool as their only parameter
+        if params and "/" in str(params[0]):
+            self.pool = ipaddress.IPv4Network(params[0])
+
+    def fetchall(self):
+        nets = [n for n in self.nets if self.pool is None or n.subnet_of(self.pool)]
+        return [{"lo": int(n.network_address), "hi": int(n.broadcast_address)} for n in nets]
+
+    def fetchone(self):
+        # VPC lookups: every name exists, numbered in first-seen order
+        name = self.executed[-1][1][0]
+        return {"id": self.vpc_ids.setdefault(name, len(self.vpc_ids) + 1)}
+
+@pytest.mark.pure
+def test_next_free_in_pool_skips_covered_blocks():
+    """Test first-fit search skips blocks covered by existing allocations"""
+    pool = ipaddress.IPv4Network("10.0.0.0/16")
+    # empty pool starts at the network address
+    assert next_free_in_pool(FakeCursor([]), pool, 24, "allocations", "primary_cidr") == ("10.0.0.0/24", [])
+    # a /23 covers two /24 blocks, a /26 dirties the block it sits in
+    cur = FakeCursor(["10.0.0.0/23", "10.0.2.64/26"])
+    assert next_free_in_pool(cur, pool, 24, "allocations", "primary_cidr") == ("10.0.3.0/24", [])
+    assert next_free_in_pool(cur, pool, 26, "allocations", "primary_cidr") == ("10.0.2.0/26", [])
+    # a full pool reports no space
+    full = FakeCursor(["10.0.0.0/17", "10.0.128.0/17"])
+    assert next_free_in_pool(full, pool, 20, "allocations", "primary_cidr") == ("", ["no_free_block"])
+
+@pytest.mark.pure
+def test_next_free_in_pool_shares_taken_ranges():
+    """Test searches sharing `taken` never hand out the same block twice"""
+    pool = ipaddress.IPv4Network("10.0.0.0/16")
+    cur = FakeCursor(["10.0.0.0/24"])
+    taken = {}
+    assert next_free_in_pool(cur, pool, 24, "allocations", "primary_cidr", taken) == ("10.0.1.0/24", [])
+    assert next_free_in_pool(cur, pool, 26, "allocations", "primary_cidr", taken) == ("10.0.2.0/26", [])
+    assert next_free_in_pool(cur, pool, 24, "allocations", "primary_cidr", taken) == ("10.0.3.0/24", [])
+
+@pytest.mark.pure
+def test_resolve_vpc_ids_in_fixed_order():
+    """Test batch VPCs are resolved in one case-insensitive order whatever the item order"""
+    for names in (["beta", "Alpha", "beta", "gamma"], ["gamma", "beta", "Alpha"]):
+        cur = FakeCursor([])
+        vpc_ids = resolve_vpc_ids(cur, names)
+        assert [params[0] for _, params in cur.executed] == ["Alpha", "beta", "gamma"]
+        assert set(vpc_ids) == set(names)
+
+def _planned(*prefixes):
+    items = [AllocationRequest(vpc=f"vpc{i}", prefix_length=p) for i, p in enumerate(prefixes)]
+    return [(item, item.prefix_length, {}) for item in items]
+
+@pytest.mark.pure
+def test_plan_batch_shares_taken_ranges():
+    """Test batch items are placed one after another from a single read of each pool"""
+    cur = FakeCursor(["10.0.0.0/24", "100.64.0.0/19"])
+    planned = _planned(24, 24, 26)
+    vpc_ids = resolve_vpc_ids(cur, [item.vpc for item, _, _ in planned])
+    results, rows = plan_batch(cur, planned, vpc_ids)
+    assert [(r["primary_cidr"], r["cgnat_cidr"]) for r in results] == [
+        ("10.0.1.0/24", "100.64.32.0/19"),
+        ("10.0.2.0/24", "100.64.64.0/19"),
+        ("10.0.3.0/26", "100.64.96.0/21"),
+    ]
+    assert [row[0] for row in rows] == [vpc_ids["vpc0"], vpc_ids["vpc1"], vpc_ids["vpc2"]]
+    # one pool scan per pool, however many items
+    scans = [params for _, params in cur.executed if "/" in str(params[0])]
+    assert len(scans) == 2
+
+@pytest.mark.pure
+def test_plan_batch_no_space_fails_whole_batch():
+    """Test an item that cannot be placed fails the batch before anything is inserted"""
+    pool = ipaddress.IPv4Network("10.0.0.0/16")
+    # every /24 but the last is allocated
+    cur = FakeCursor([str(n) for n in pool.subnets(new_prefix=24)][:-1])
+    with pytest.raises(HTTPException) as exc:
+        plan_batch(cur, _planned(24, 24), {"vpc0": 1, "vpc1": 2})
+    assert exc.value.detail["code"] == "NO_SPACE"
+    assert exc.value.detail["details"]["item"] == 1
+    assert not any("INSERT" in query for query, _ in cur.executed)
+
+@pytest.mark.pure
+def test_next_request_id():
+    """Test request ids are unique and fit the UUID request_id column"""
+    ids = [next_request_id() for _ in range(1000)]
+    assert len(set(ids)) == len(ids)
+    for rid in ids[:10]:
+        assert len(rid) == 32
+        assert uuid.UUID(rid).hex == rid
+
+def _load_cli():
+    """ipam-cli.py as a module (its file name is not importable)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ipam-cli.py")
+    spec = importlib.util.spec_from_file_location("ipam_cli", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.mark.pure
+def test_cli_requested_command():
+    """Test the argv scan that picks which subcommand parser to build"""
+    cli = _load_cli()
+    assert cli._requested_command(["--api-key", "k", "list"]) == "list"
+    assert cli._requested_command(["--api", "k", "--url", "http://x", "calculate", "--hosts", "5"]) == "calculate"
+    assert cli._requested_command(["--url=http://x", "--api-key=k", "delete", "3"]) == "delete"
+    assert cli._requested_command(["--cache", "--api-key", "list", "calculate"]) == "calculate"
+    # help, unknown commands and anything ambiguous build every parser
+    assert cli._requested_command(["-h", "list"]) is None
+    assert cli._requested_command(["--api-key", "k", "bogus"]) is None
+    assert cli._requested_command(["--api-key", "k"]) is None
+    assert cli._requested_command(["--api-key", "k", "--", "list"]) is None
+
+@pytest.mark.pure
+def test_cli_parse_args_matches_full_parser():
+    """Test the single-command fast path parses like the full parser and errors like it too"""
+    cli = _load_cli()
+    _, args = cli.parse_args(["--api-key", "k", "allocate", "prod", "--hosts", "50", "--env", "dev"])
+    assert (args.command, args.vpc, args.hosts, args.env) == ("allocate", "prod", 50, "dev")
+    stderr = io.StringIO()
+    with contextlib.redirect_stderr(stderr), pytest.raises(SystemExit):
+        cli.parse_args(["list"])
+    assert "{create-vpc,allocate,list,delete,calculate,batch}" in stderr.getvalue()
+    assert "--api-key" in stderr.getvalue()
+
 if __name__ == "__main__":
     # Run tests manually if pytest not available
     test_hosts_to_prefix_length()
     test_usable_count()  
+    test_calculate_rejects_out_of_range_prefix()
     test_cidr_pools()
     test_cgnat_sizing_relationship()
+    test_int_to_cidr_matches_ipaddress()
+    test_next_free_in_pool_skips_covered_blocks()
+    test_next_free_in_pool_shares_taken_ranges()
+    test_resolve_vpc_ids_in_fixed_order()
+    test_plan_batch_shares_taken_ranges()
+    test_plan_batch_no_space_fails_whole_batch()
+    test_next_request_id()
+    test_cli_requested_command()
+    test_cli_parse_args_matches_full_parser()
     print("All tests passed!")
\ No newline at end of file